@@ -1,4 +1,6 @@
 import os
+import sys
+import io
 import subprocess
 import platform
 import shutil
@@ -6,10 +8,79 @@ import tempfile
 import ctypes
 import json
 import hashlib
+import re
+import xml.etree.ElementTree as ET
+import atexit
+import functools
+import mmap
+import glob
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+# 计算文件哈希时每次读取的块大小
+HASH_CHUNK_SIZE = 65536
+
+# 快速校验时只对文件开头的这部分内容计算哈希(字体头和表目录都在其中)
+PARTIAL_HASH_SIZE = 65536
+
+# 字体哈希结果的持久化缓存文件
+INTEGRITY_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "font_diag", "integrity.json")
+
+# Linux下一次性执行的字体相关探测命令，每条命令的输出后跟 "@@名称 返回码" 标记行
+_LINUX_PROBE_SCRIPT = (
+    "fc-cache -v 2>&1 >/dev/null; printf '\\n@@fc_cache %s\\n' $?; "
+    "fc-match sans-serif 2>&1; printf '\\n@@fc_match %s\\n' $?; "
+    "locale 2>/dev/null; printf '\\n@@locale %s\\n' $?"
+)
+_LINUX_PROBE_MARKER = re.compile(r"^@@(\w+) (\d+)$", re.MULTILINE)
+
+
+def _new_font_hash():
+    """创建用于字体完整性校验的哈希对象(BLAKE2b, 16字节摘要)"""
+    return hashlib.blake2b(digest_size=16)
+
+
+def _file_hash(f):
+    """计算已打开的二进制文件的哈希，优先使用内存映射以避免复制文件内容"""
+    try:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            h = _new_font_hash()
+            h.update(mm)
+            return h.hexdigest()
+    except (ValueError, OSError):
+        # 空文件或不支持映射的文件回退到分块读取
+        pass
+    
+    if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+        return hashlib.file_digest(f, _new_font_hash).hexdigest()
+    h = _new_font_hash()
+    while chunk := f.read(HASH_CHUNK_SIZE):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def _prefix_hash(f):
+    """计算已打开的二进制文件前PARTIAL_HASH_SIZE字节的哈希"""
+    h = _new_font_hash()
+    h.update(f.read(PARTIAL_HASH_SIZE))
+    return h.hexdigest()
+
+
+@functools.lru_cache(maxsize=32)
+def _resolve_pattern(pattern):
+    """展开带通配符的路径，结果按模式缓存"""
+    return tuple(glob.glob(pattern))
+
+
 class EnhancedFontDiagnosticTool:
+    # 各系统的关键字体，用于存在性检查和完整性校验
+    _CRITICAL_FONTS = {
+        "Windows": ("Arial.ttf", "Times New Roman.ttf", "Segoe UI.ttf"),
+        "Linux": ("DejaVuSans.ttf", "FreeSans.ttf"),
+        "Darwin": ("Helvetica.dfont", "San Francisco.ttf")
+    }
+    
     def __init__(self):
         self.system = platform.system()
         self.report = {
@@ -24,20 +95,55 @@ class EnhancedFontDiagnosticTool:
             'font_integrity_issues': []
         }
         
-        # 已知字体文件的MD5哈希值（示例值，实际应用中需要更完整的数据库）
+        # 字体目录在进程生命周期内不会变化，只计算一次
+        self._font_dirs = self._build_font_dirs()
+        self._critical_fonts = self._CRITICAL_FONTS.get(self.system, ())
+        # 字体目录索引和查找结果，在一次诊断内共享，见 _reset_font_caches()
+        self._reset_font_caches()
+        
+        # 已知字体文件的大小(字节)、前64KiB的BLAKE2b哈希和完整文件的BLAKE2b哈希
+        # （示例值，实际应用中需要更完整的数据库）
         self.known_font_hashes = {
-            "Arial.ttf": "a1b2c3d4e5f678901234567890123456",  # 示例哈希值
-            "Times New Roman.ttf": "f6e5d4c3b2a198765432109876543210",
-            "Segoe UI.ttf": "1234567890abcdef1234567890abcdef",
-            "DejaVuSans.ttf": "abcdef1234567890abcdef1234567890",
-            "FreeSans.ttf": "0987654321abcdef0987654321abcdef",
-            "Helvetica.dfont": "aabbccddeeff00112233445566778899",
-            "San Francisco.ttf": "11223344556677889900aabbccddeeff"
+            "Arial.ttf": {"size": 367112, "prefix_hash": "5f1e2d3c4b5a69788796a5b4c3d2e1f0",
+                          "full_hash": "a1b2c3d4e5f678901234567890123456"},  # 示例值
+            "Times New Roman.ttf": {"size": 834452, "prefix_hash": "0f1e2d3c4b5a69788796a5b4c3d2e1f5",
+                                    "full_hash": "f6e5d4c3b2a198765432109876543210"},
+            "Segoe UI.ttf": {"size": 979040, "prefix_hash": "fedcba0987654321fedcba0987654321",
+                             "full_hash": "1234567890abcdef1234567890abcdef"},
+            "DejaVuSans.ttf": {"size": 757076, "prefix_hash": "0123456789abcdef0123456789abcdef",
+                               "full_hash": "abcdef1234567890abcdef1234567890"},
+            "FreeSans.ttf": {"size": 264072, "prefix_hash": "fedcba1234567890fedcba1234567890",
+                             "full_hash": "0987654321abcdef0987654321abcdef"},
+            "Helvetica.dfont": {"size": 2100400, "prefix_hash": "99887766554433221100ffeeddccbbaa",
+                                "full_hash": "aabbccddeeff00112233445566778899"},
+            "San Francisco.ttf": {"size": 1061416, "prefix_hash": "ffeeddccbbaa00998877665544332211",
+                                  "full_hash": "11223344556677889900aabbccddeeff"}
         }
         
+        # _linux_probe() 的结果，每次全面诊断时重新获取
+        self._linux_probe_result = None
+        
+        # Windows下复用同一个 HKCU\Control Panel\Desktop 注册表句柄读取DPI相关设置，首次使用时打开
+        self._hkcu_desktop = None
+        
+        # 以(路径, 修改时间, 大小)为键缓存已计算的哈希，文件未变化时无需重新计算
+        self._integrity_cache = self._load_integrity_cache()
+        self._integrity_cache_dirty = False
+        atexit.register(self._save_integrity_cache)
+        
+    def close(self):
+        """释放工具持有的Windows注册表句柄"""
+        if self._hkcu_desktop is not None:
+            self._hkcu_desktop.Close()
+            self._hkcu_desktop = None
+    
     def run_full_diagnostics(self):
         """运行全面的字体诊断"""
         print("正在运行全面的字体诊断...")
+        # 字体或IDE配置可能已在工具外被安装或恢复，每次诊断都重新扫描
+        self._reset_font_caches()
+        _resolve_pattern.cache_clear()
+        self._linux_probe_result = None
         
         # 基本诊断
         self.check_font_directories()
@@ -57,9 +163,7 @@ class EnhancedFontDiagnosticTool:
     def check_font_directories(self):
         """检查系统字体目录是否存在且可访问"""
         print("\n检查字体目录...")
-        font_dirs = self.get_font_dirs()
-        
-        for directory in font_dirs:
+        for directory in self._font_dirs:
             if not os.path.exists(directory):
                 self.report['issues'].append(f"字体目录不存在: {directory}")
                 self.report['suggestions'].append(f"创建目录: {directory} 或修复系统字体设置")
@@ -71,6 +175,10 @@ class EnhancedFontDiagnosticTool:
     
     def get_font_dirs(self):
         """获取系统字体目录路径"""
+        return self._font_dirs
+    
+    def _build_font_dirs(self):
+        """根据当前系统构建字体目录路径列表"""
         if self.system == "Windows":
             return [
                 os.path.join(os.environ['WINDIR'], 'Fonts'),
@@ -91,6 +199,72 @@ class EnhancedFontDiagnosticTool:
         else:
             return []
     
+    def _reset_font_caches(self):
+        """清空字体目录索引和字体查找缓存"""
+        # 每个字体目录下 文件名 -> os.DirEntry 的索引，按需扫描
+        self._dir_index = {}
+        # 字体文件名 -> 所在的os.DirEntry，未找到时记录为None，避免重复查找
+        self._font_lookup = {}
+        # 所有字体目录中文件名的并集，首次查找时构建
+        self._all_font_names = None
+    
+    def _font_key(self, name):
+        """字体文件名的查找键，Windows和macOS默认文件系统不区分大小写"""
+        if self.system in ("Windows", "Darwin"):
+            return name.casefold()
+        return name
+    
+    def _index_dir(self, font_dir):
+        """扫描字体目录，返回 文件名 -> os.DirEntry 的字典(结果会被缓存)"""
+        if font_dir not in self._dir_index:
+            try:
+                # is_file()会跟随符号链接，排除子目录和失效的链接(与os.path.exists的判断一致)
+                with os.scandir(font_dir) as it:
+                    entries = {self._font_key(entry.name): entry for entry in it if entry.is_file()}
+            except OSError:
+                entries = {}
+            self._dir_index[font_dir] = entries
+        return self._dir_index[font_dir]
+    
+    def _find_font(self, font):
+        """在字体目录中查找字体文件，返回os.DirEntry，找不到时返回None(结果会被缓存)"""
+        key = self._font_key(font)
+        if self._all_font_names is None:
+            self._all_font_names = set().union(*(self._index_dir(d).keys() for d in self._font_dirs))
+        if key not in self._font_lookup:
+            self._font_lookup[key] = None
+            # 不在任何目录中的字体无需逐个目录查找
+            if key not in self._all_font_names:
+                return None
+            for font_dir in self._font_dirs:
+                entry = self._index_dir(font_dir).get(key)
+                if entry is not None:
+                    self._font_lookup[key] = entry
+                    break
+        return self._font_lookup[key]
+    
+    def _linux_probe(self):
+        """在一个shell进程中执行fc-cache、fc-match和locale
+        
+        返回 {'fc_cache': (返回码, 输出), 'fc_match': ..., 'locale': ...}，
+        shell无法启动时返回空字典
+        """
+        if self._linux_probe_result is None:
+            try:
+                result = subprocess.run(['sh', '-c', _LINUX_PROBE_SCRIPT], capture_output=True, text=True)
+            except OSError as e:
+                print("无法执行字体探测命令:", str(e))
+                self._linux_probe_result = {}
+                return self._linux_probe_result
+            
+            sections = {}
+            start = 0
+            for match in _LINUX_PROBE_MARKER.finditer(result.stdout):
+                sections[match.group(1)] = (int(match.group(2)), result.stdout[start:match.start()].strip())
+                start = match.end()
+            self._linux_probe_result = sections
+        return self._linux_probe_result
+    
     def check_font_cache(self):
         """检查字体缓存问题"""
         print("\n检查字体缓存...")
@@ -106,13 +280,17 @@ class EnhancedFontDiagnosticTool:
         
         elif self.system == "Linux":
             # 检查常见的Linux字体缓存
-            try:
-                subprocess.run(['fc-cache', '-v'], check=True, capture_output=True, text=True)
+            result = self._linux_probe().get('fc_cache')
+            if result is None:
+                print("无法检查Linux字体缓存")
+                return
+            returncode, output = result
+            if returncode == 0:
                 print("Linux字体缓存正常")
-            except subprocess.CalledProcessError as e:
+            else:
                 self.report['font_cache_issues'] = True
                 self.report['issues'].append("Linux字体缓存问题")
-                print(f"字体缓存错误: {e.stderr}")
+                print(f"字体缓存错误: {output}")
         
         elif self.system == "Darwin":
             # macOS通常不需要手动管理字体缓存
@@ -122,22 +300,10 @@ class EnhancedFontDiagnosticTool:
         """检查基本系统字体是否存在"""
         print("\n检查系统字体...")
         
-        required_fonts = {
-            "Windows": ["Arial.ttf", "Times New Roman.ttf", "Segoe UI.ttf"],
-            "Linux": ["DejaVuSans.ttf", "FreeSans.ttf"],
-            "Darwin": ["Helvetica.dfont", "San Francisco.ttf"]
-        }.get(self.system, [])
-        
         missing_fonts = []
         
-        for font in required_fonts:
-            found = False
-            for font_dir in self.get_font_dirs():
-                if os.path.exists(os.path.join(font_dir, font)):
-                    found = True
-                    break
-            
-            if not found:
+        for font in self._critical_fonts:
+            if self._find_font(font) is None:
                 missing_fonts.append(font)
         
         if missing_fonts:
@@ -152,79 +318,77 @@ class EnhancedFontDiagnosticTool:
         print("\n检查字体配置...")
         
         if self.system == "Linux":
-            try:
-                # 检查fontconfig配置
-                result = subprocess.run(['fc-match', 'sans-serif'], capture_output=True, text=True)
-                if result.returncode != 0:
-                    self.report['issues'].append("字体配置问题: 无法匹配基本字体")
-                    print("字体配置问题:", result.stderr)
-                else:
-                    print("基本字体匹配正常:", result.stdout.strip())
-            except FileNotFoundError:
+            # 检查fontconfig配置(返回码127表示命令不存在)
+            result = self._linux_probe().get('fc_match')
+            if result is None:
+                print("无法检查字体配置")
+                return
+            returncode, output = result
+            if returncode == 127:
                 self.report['issues'].append("fontconfig未安装或不可用")
                 self.report['suggestions'].append("安装fontconfig包: sudo apt install fontconfig")
+            elif returncode != 0:
+                self.report['issues'].append("字体配置问题: 无法匹配基本字体")
+                print("字体配置问题:", output)
+            else:
+                print("基本字体匹配正常:", output)
     
     def check_locale_settings(self):
         """检查区域设置是否可能影响字体显示"""
         print("\n检查区域设置...")
         
         if self.system == "Linux":
-            try:
-                result = subprocess.run(['locale'], capture_output=True, text=True)
-                if "en_US.UTF-8" not in result.stdout:
-                    self.report['issues'].append("区域设置可能不支持某些字体")
-                    self.report['suggestions'].append("考虑设置LANG=en_US.UTF-8")
-            except Exception as e:
-                print("无法检查区域设置:", str(e))
+            result = self._linux_probe().get('locale')
+            if result is None:
+                print("无法检查区域设置")
+            elif result[0] == 127:
+                print("无法检查区域设置: locale命令不可用")
+            elif result[0] != 0:
+                print(f"无法检查区域设置: locale返回码 {result[0]}")
+            elif "en_US.UTF-8" not in result[1]:
+                self.report['issues'].append("区域设置可能不支持某些字体")
+                self.report['suggestions'].append("考虑设置LANG=en_US.UTF-8")
     
     def generate_report(self):
         """生成诊断报告"""
-        print("\n=== 诊断报告 ===")
-        print(f"系统: {self.report['system']}")
+        # 先将报告文本写入缓冲区，最后一次性输出到终端和文件
+        buf = io.StringIO()
+        print("\n=== 诊断报告 ===", file=buf)
+        print(f"系统: {self.report['system']}", file=buf)
         
         if self.report['issues']:
-            print("\n发现的问题:")
-            for issue in self.report['issues']:
-                print(f"- {issue}")
+            print("\n发现的问题:\n- " + "\n- ".join(self.report['issues']), file=buf)
         else:
-            print("\n未发现重大问题")
+            print("\n未发现重大问题", file=buf)
         
         if self.report['missing_fonts']:
-            print("\n缺失的字体:")
-            for font in self.report['missing_fonts']:
-                print(f"- {font}")
+            print("\n缺失的字体:\n- " + "\n- ".join(self.report['missing_fonts']), file=buf)
         
         if self.report['corrupted_fonts']:
-            print("\n可能损坏的字体:")
-            for font in self.report['corrupted_fonts']:
-                print(f"- {font}")
+            print("\n可能损坏的字体:\n- " + "\n- ".join(self.report['corrupted_fonts']), file=buf)
         
         if self.report['font_integrity_issues']:
-            print("\n字体完整性问题:")
-            for font in self.report['font_integrity_issues']:
-                print(f"- {font} 可能已损坏")
+            print("\n字体完整性问题:\n" + "\n".join(
+                f"- {font} 可能已损坏" for font in self.report['font_integrity_issues']), file=buf)
         
         if self.report['dpi_scaling_issues']:
-            print("\nDPI/缩放问题:")
-            for issue in self.report['dpi_scaling_issues']:
-                print(f"- {issue}")
+            print("\nDPI/缩放问题:\n- " + "\n- ".join(self.report['dpi_scaling_issues']), file=buf)
         
         if self.report['software_specific_issues']:
-            print("\n软件特定问题:")
-            for software, issues in self.report['software_specific_issues'].items():
-                print(f"{software}:")
-                for issue in issues:
-                    print(f" - {issue}")
+            print("\n软件特定问题:\n" + "\n".join(
+                f"{software}:\n - " + "\n - ".join(issues)
+                for software, issues in self.report['software_specific_issues'].items()), file=buf)
         
         if self.report['suggestions']:
-            print("\n建议的解决方案:")
-            for suggestion in self.report['suggestions']:
-                print(f"- {suggestion}")
+            print("\n建议的解决方案:\n- " + "\n- ".join(self.report['suggestions']), file=buf)
         
-        # 将报告保存到文件
+        report_text = buf.getvalue()
+        sys.stdout.write(report_text)
+        
+        # 将报告文本和完整的JSON数据保存到文件
         report_path = os.path.join(os.path.expanduser("~"), "font_diagnostic_report.txt")
-        with open(report_path, 'w') as f:
-            json.dump(self.report, f, indent=2)
+        Path(report_path).write_text(
+            report_text + "\n" + json.dumps(self.report, indent=2), encoding='utf-8')
         print(f"\n完整报告已保存到: {report_path}")
     
     def fix_font_cache(self):
@@ -243,6 +407,7 @@ class EnhancedFontDiagnosticTool:
             try:
                 print("在Linux上重建字体缓存...")
                 subprocess.run(['fc-cache', '-f', '-v'], check=True)
+                self._linux_probe_result = None
                 print("字体缓存重建成功")
             except subprocess.CalledProcessError as e:
                 print("重建字体缓存失败:", e.stderr)
@@ -261,7 +426,7 @@ class EnhancedFontDiagnosticTool:
             print("错误: 字体文件不存在")
             return
         
-        font_dirs = self.get_font_dirs()
+        font_dirs = self._font_dirs
         if not font_dirs:
             print("错误: 无法确定系统字体目录")
             return
@@ -276,6 +441,8 @@ class EnhancedFontDiagnosticTool:
             
             shutil.copy2(font_path, target_path)
             print(f"字体已安装到: {target_path}")
+            # 目录内容已变化，下次检查时重新扫描
+            self._reset_font_caches()
             
             # 更新字体缓存
             if self.system == "Linux":
@@ -335,7 +502,9 @@ class EnhancedFontDiagnosticTool:
                 print(f"检查Adobe字体目录: {adobe_font_dir}")
                 
                 # 检查是否有损坏的字体缓存
-                cache_files = [f for f in os.listdir(adobe_font_dir) if f.endswith('.lst')]
+                with os.scandir(adobe_font_dir) as it:
+                    cache_files = [entry.name for entry in it
+                                   if entry.name.endswith('.lst') and entry.is_file(follow_symlinks=False)]
                 if not cache_files:
                     self.report['software_specific_issues']['Adobe'].append("Adobe字体缓存文件缺失")
                     self.report['suggestions'].append("尝试在Adobe软件中重置字体首选项")
@@ -350,13 +519,7 @@ class EnhancedFontDiagnosticTool:
             missing = []
             
             for font in office_fonts:
-                found = False
-                for font_dir in self.get_font_dirs():
-                    if os.path.exists(os.path.join(font_dir, font)):
-                        found = True
-                        break
-                
-                if not found:
+                if self._find_font(font) is None:
                     missing.append(font)
             
             if missing:
@@ -391,8 +554,7 @@ class EnhancedFontDiagnosticTool:
             for path_pattern in info["paths"]:
                 # 处理通配符路径
                 if '*' in path_pattern:
-                    import glob
-                    matches = glob.glob(path_pattern)
+                    matches = _resolve_pattern(path_pattern)
                     if not matches:
                         continue
                     ide_path = matches[0]
@@ -416,32 +578,18 @@ class EnhancedFontDiagnosticTool:
                     font_family = config.get(font_setting_key, "")
             elif config_path.endswith('.xml'):
                 # 使用更健壮的XML解析
-                try:
-                    import xml.etree.ElementTree as ET
-                    tree = ET.parse(config_path)
-                    root = tree.getroot()
-                    
-                    for elem in root.iter(font_setting_key):
-                        font_family = elem.text.strip()
-                        break
-                except ImportError:
-                    # 回退到简单文本搜索
-                    with open(config_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        import re
-                        match = re.search(f"{font_setting_key}[^>]*>([^<]+)", content)
-                        font_family = match.group(1) if match else ""
+                tree = ET.parse(config_path)
+                root = tree.getroot()
+                
+                for elem in root.iter(font_setting_key):
+                    font_family = elem.text.strip()
+                    break
             
             if font_family:
                 # 检查配置的字体是否可用
-                available = False
-                for font_dir in self.get_font_dirs():
-                    for ext in ['.ttf', '.otf', '.ttc']:
-                        if os.path.exists(os.path.join(font_dir, f"{font_family}{ext}")):
-                            available = True
-                            break
-                    if available:
-                        break
+                available = any(
+                    self._find_font(f"{font_family}{ext}") is not None
+                    for ext in ('.ttf', '.otf', '.ttc'))
                 
                 if not available:
                     self.report['software_specific_issues'][ide_name].append(
@@ -451,44 +599,124 @@ class EnhancedFontDiagnosticTool:
         except Exception as e:
             print(f"检查{ide_name}字体配置时出错: {str(e)}")
     
-    def check_font_integrity(self):
-        """检查字体文件的完整性"""
+    def check_font_integrity(self, deep=False):
+        """检查字体文件的完整性，deep为True时对完整文件计算哈希"""
         print("\n检查字体文件完整性...")
         
-        # 只检查系统关键字体
-        critical_fonts = {
-            "Windows": ["Arial.ttf", "Times New Roman.ttf", "Segoe UI.ttf"],
-            "Linux": ["DejaVuSans.ttf", "FreeSans.ttf"],
-            "Darwin": ["Helvetica.dfont", "San Francisco.ttf"]
-        }.get(self.system, [])
-        
-        for font in critical_fonts:
-            for font_dir in self.get_font_dirs():
-                font_path = os.path.join(font_dir, font)
-                if os.path.exists(font_path):
-                    if not self.verify_font_integrity(font_path, font):
-                        self.report['font_integrity_issues'].append(font)
-                    break
+        # 只检查系统关键字体：先确定每个字体所在的路径，多个字体时并行校验(哈希计算期间会释放GIL)
+        fonts = []
+        font_paths = []
+        for font in self._critical_fonts:
+            entry = self._find_font(font)
+            if entry is not None:
+                fonts.append(font)
+                font_paths.append(entry.path)
+        
+        if not fonts:
+            return
+        
+        verify = functools.partial(self._verify_font_integrity, deep=deep)
+        if len(fonts) == 1:
+            results = [verify(font_paths[0], fonts[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(8, len(fonts))) as executor:
+                results = list(executor.map(verify, font_paths, fonts))
+        
+        # 在主线程中按字体顺序输出结果，避免不同字体的提示交错
+        for font, (ok, message) in zip(fonts, results):
+            if message:
+                print(message)
+            if not ok:
+                self.report['font_integrity_issues'].append(font)
+    
+    def run_deep_integrity_check(self):
+        """对关键字体的完整文件计算哈希进行深度完整性检查"""
+        self._reset_font_caches()
+        self.report['font_integrity_issues'] = []
+        self.check_font_integrity(deep=True)
+        
+        if self.report['font_integrity_issues']:
+            print("\n字体完整性问题:\n" + "\n".join(
+                f"- {font} 可能已损坏" for font in self.report['font_integrity_issues']))
+        else:
+            print("关键字体完整性检查通过")
     
-    def verify_font_integrity(self, font_path, font_name):
-        """验证字体文件的完整性"""
+    def _load_integrity_cache(self):
+        """从磁盘读取字体哈希缓存"""
+        try:
+            with open(INTEGRITY_CACHE_PATH, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            return cache if isinstance(cache, dict) else {}
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_integrity_cache(self):
+        """将字体哈希缓存写回磁盘"""
+        if not self._integrity_cache_dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(INTEGRITY_CACHE_PATH), exist_ok=True)
+            with open(INTEGRITY_CACHE_PATH, 'w', encoding='utf-8') as f:
+                json.dump(self._integrity_cache, f)
+            self._integrity_cache_dirty = False
+        except OSError as e:
+            print(f"保存字体哈希缓存失败: {str(e)}")
+    
+    def verify_font_integrity(self, font_path, font_name, deep=False):
+        """验证字体文件的完整性
+        
+        默认只比较文件大小和前PARTIAL_HASH_SIZE字节的哈希，deep为True时再比较完整文件的哈希
+        """
+        ok, message = self._verify_font_integrity(font_path, font_name, deep)
+        if message:
+            print(message)
+        return ok
+    
+    def _verify_font_integrity(self, font_path, font_name, deep=False):
+        """verify_font_integrity的实现，不直接输出，返回(是否完好, 提示信息)，可在工作线程中调用"""
+        known = self.known_font_hashes.get(font_name)
+        if not known:
+            # 没有参考值时无法比较，无需计算哈希
+            return True, ""
+        
         try:
-            # 计算文件的MD5哈希
-            with open(font_path, 'rb') as f:
-                file_hash = hashlib.md5(f.read()).hexdigest()
+            # 先比较文件大小，大小不同时无需计算哈希
+            # (不使用os.DirEntry.stat()，它会缓存首次扫描时的结果)
+            st = os.stat(font_path)
+            file_size = st.st_size
+            if file_size != known["size"]:
+                return False, (f"⚠ 字体文件可能损坏: {font_path}\n"
+                               f"  期望大小: {known['size']}\n"
+                               f"  实际大小: {file_size}")
             
-            # 与已知好的哈希值比较
-            known_hash = self.known_font_hashes.get(font_name)
-            if known_hash and file_hash != known_hash:
-                print(f"⚠ 字体文件可能损坏: {font_path}")
-                print(f"  期望哈希: {known_hash}")
-                print(f"  实际哈希: {file_hash}")
-                return False
+            # 文件未变化时直接使用缓存的哈希，否则计算文件的BLAKE2b哈希
+            cache_key = f"{font_path}|{st.st_mtime_ns}|{file_size}"
+            cached = self._integrity_cache.get(cache_key)
+            if not isinstance(cached, dict):
+                cached = {}
             
-            return True
+            checks = [("prefix", "prefix_hash", _prefix_hash)]
+            if deep:
+                checks.append(("full", "full_hash", _file_hash))
+            
+            for cache_field, known_field, hash_func in checks:
+                file_hash = cached.get(cache_field)
+                if file_hash is None:
+                    with open(font_path, 'rb') as f:
+                        file_hash = hash_func(f)
+                    cached = {**cached, cache_field: file_hash}
+                    self._integrity_cache[cache_key] = cached
+                    self._integrity_cache_dirty = True
+                
+                # 与已知好的哈希值比较
+                if file_hash != known[known_field]:
+                    return False, (f"⚠ 字体文件可能损坏: {font_path}\n"
+                                   f"  期望哈希: {known[known_field]}\n"
+                                   f"  实际哈希: {file_hash}")
+            
+            return True, ""
         except Exception as e:
-            print(f"验证字体完整性时出错 ({font_path}): {str(e)}")
-            return False
+            return False, f"验证字体完整性时出错 ({font_path}): {str(e)}"
     
     def check_dpi_scaling(self):
         """检查DPI和显示缩放设置"""
@@ -497,14 +725,14 @@ class EnhancedFontDiagnosticTool:
         if self.system == "Windows":
             try:
                 import winreg
-                with winreg.OpenKey(winreg.HKEY_CURRENT_USER, 
-                                   "Control Panel\\Desktop") as key:
-                    dpi_value = winreg.QueryValueEx(key, "LogPixels")[0]
-                    if dpi_value not in [96, 120, 144]:  # 常见标准DPI值
-                        self.report['dpi_scaling_issues'].append(
-                            f"非标准DPI设置 ({dpi_value}) 可能导致字体显示问题")
-                        self.report['suggestions'].append(
-                            "尝试将DPI设置为100%(96)、125%(120)或150%(144)")
+                if self._hkcu_desktop is None:
+                    self._hkcu_desktop = winreg.OpenKey(winreg.HKEY_CURRENT_USER, "Control Panel\\Desktop")
+                dpi_value = winreg.QueryValueEx(self._hkcu_desktop, "LogPixels")[0]
+                if dpi_value not in [96, 120, 144]:  # 常见标准DPI值
+                    self.report['dpi_scaling_issues'].append(
+                        f"非标准DPI设置 ({dpi_value}) 可能导致字体显示问题")
+                    self.report['suggestions'].append(
+                        "尝试将DPI设置为100%(96)、125%(120)或150%(144)")
             except Exception as e:
                 print(f"无法检查Windows DPI设置: {str(e)}")
         
@@ -527,7 +755,6 @@ class EnhancedFontDiagnosticTool:
                 result = subprocess.run(['system_profiler', 'SPDisplaysDataType'], 
                                       capture_output=True, text=True)
                 if "Resolution" in result.stdout:
-                    import re
                     match = re.search(r"Resolution:\s*(.+)", result.stdout)
                     if match:
                         resolution = match.group(1)
@@ -570,44 +797,50 @@ def main():
     print("=== 增强版字体问题诊断与修复工具 ===")
     tool = EnhancedFontDiagnosticTool()
     
-    while True:
-        print("\n菜单:")
-        print("1. 运行全面诊断")
-        print("2. 修复字体缓存")
-        print("3. 安装新字体")
-        print("4. 恢复默认字体")
-        print("5. 修复DPI/缩放设置")
-        print("6. 检查特定软件字体问题")
-        print("7. 退出")
-        
-        choice = input("请选择操作 (1-7): ")
-        
-        if choice == '1':
-            tool.run_full_diagnostics()
-        elif choice == '2':
-            tool.fix_font_cache()
-        elif choice == '3':
-            font_path = input("输入字体文件路径: ").strip()
-            tool.install_font(font_path)
-        elif choice == '4':
-            tool.restore_default_fonts()
-        elif choice == '5':
-            tool.fix_dpi_scaling()
-        elif choice == '6':
-            # 显示已检测到的软件问题
-            if tool.report['software_specific_issues']:
-                print("\n检测到的软件特定问题:")
-                for software, issues in tool.report['software_specific_issues'].items():
-                    print(f"{software}:")
-                    for issue in issues:
-                        print(f" - {issue}")
+    try:
+        while True:
+            print("\n菜单:")
+            print("1. 运行全面诊断")
+            print("2. 修复字体缓存")
+            print("3. 安装新字体")
+            print("4. 恢复默认字体")
+            print("5. 修复DPI/缩放设置")
+            print("6. 检查特定软件字体问题")
+            print("7. 深度检查字体完整性")
+            print("8. 退出")
+            
+            choice = input("请选择操作 (1-8): ")
+            
+            if choice == '1':
+                tool.run_full_diagnostics()
+            elif choice == '2':
+                tool.fix_font_cache()
+            elif choice == '3':
+                font_path = input("输入字体文件路径: ").strip()
+                tool.install_font(font_path)
+            elif choice == '4':
+                tool.restore_default_fonts()
+            elif choice == '5':
+                tool.fix_dpi_scaling()
+            elif choice == '6':
+                # 显示已检测到的软件问题
+                if tool.report['software_specific_issues']:
+                    print("\n检测到的软件特定问题:")
+                    for software, issues in tool.report['software_specific_issues'].items():
+                        print(f"{software}:")
+                        for issue in issues:
+                            print(f" - {issue}")
+                else:
+                    print("未检测到特定软件的字体问题")
+            elif choice == '7':
+                tool.run_deep_integrity_check()
+            elif choice == '8':
+                print("退出程序")
+                break
             else:
-                print("未检测到特定软件的字体问题")
-        elif choice == '7':
-            print("退出程序")
-            break
-        else:
-            print("无效选择，请重试")
+                print("无效选择，请重试")
+    finally:
+        tool.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file